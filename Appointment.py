@@ -4,6 +4,9 @@ Appointment class for Distributed Calendar implemented with Wuu-Bernstein Algori
 
 from datetime import time
 
+DAYS = ["sunday", "monday", "tuesday", "wednesday", "thursday", "friday",
+"saturday"]
+
 def _parse_time(time_string):
     """Return a time object from given string or raise exception."""
     #enforce string type
@@ -80,6 +83,50 @@ def is_appointments_conflicting(appt1, appt2):
     #if there's any overlap, they are in conflict
     return True
 
+def find_conflicting_pairs(existing, new):
+    """
+    Return a sorted list of (new_index, existing_index) tuples of every pair
+    of an Appointment in list new and one in list existing that are
+    conflicting.
+
+    All Appointments are assumed to be on the same day. The Appointments of
+    each participant are swept in order of start time, so each one is only
+    compared against that participant's Appointments still in progress when
+    it starts.
+    """
+    #intervals of every participant, tagged with their list and index
+    participants = {}
+    for is_new, appointments in ((0, existing), (1, new)):
+        for i, X in enumerate(appointments):
+            for participant in X._participants:
+                participants.setdefault(participant, []).append(
+                    (X._start, X._end, is_new, i))
+
+    pairs = set()
+    for intervals in participants.itervalues():
+        intervals.sort()
+
+        active = []
+        for start, end, is_new, i in intervals:
+            #drop every appointment that ended by the time this one starts
+            active = [a for a in active if a[0] > start]
+
+            X = new[i] if is_new else existing[i]
+            for a_end, a_is_new, j in active:
+                #only pairs of one new and one existing appointment are wanted
+                if a_is_new == is_new:
+                    continue
+
+                Y = new[j] if a_is_new else existing[j]
+                if X == Y:
+                    continue
+
+                pairs.add((i, j) if is_new else (j, i))
+
+            active.append((end, is_new, i))
+
+    return sorted(pairs)
+
 class Appointment(object):
     """
     Appointment class.
@@ -102,11 +149,8 @@ class Appointment(object):
         if not isinstance(day, str):
             raise TypeError("day parameter must be of type string.")
 
-        days = ["sunday", "monday", "tuesday", "wednesday", "thursday",
-        "friday", "saturday"]
-
         #enforce day as a valid day of the week
-        if day.lower() not in days:
+        if day.lower() not in DAYS:
             raise ValueError("day parameter must be a day of the week.")
 
         start = _parse_time(start_time)
@@ -150,7 +194,7 @@ class Appointment(object):
 
     def __ne__(self, other):
         """Determine if two Appointment objects are not equivalent."""
-        return not __eq__(self, other)
+        return not self.__eq__(other)
 
     def __str__(self):
         """Convert event object to human readable string representation."""
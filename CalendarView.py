@@ -0,0 +1,130 @@
+"""
+Sorted calendar view for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+"""
+
+from bisect import bisect_left
+from Appointment import Appointment, DAYS
+from SlotIndex import SLOTS_PER_DAY, time_to_slot
+
+#the view is split into one bucket per day and start slot, in sorted order
+BUCKETS = len(DAYS) * SLOTS_PER_DAY
+
+def _sort_key(X):
+    """Return the key ordering Appointment X by day, start and participants."""
+    return (DAYS.index(X._day.lower()), X._start,
+            tuple(sorted(X._participants)), X._name)
+
+def _bucket(key):
+    """Return the index of the bucket of the appointment with sort key key."""
+    return key[0] * SLOTS_PER_DAY + time_to_slot(key[1])
+
+
+class CalendarView(object):
+    """
+    Materialized view of a calendar sorted by day, start time and
+    participants, with appointment name as the final tie breaker.
+
+    state:          2-tuple of a tuple of BUCKETS lists, one per day and start
+                    slot in sorted order, each a sorted list of the (key,
+                    Appointment) tuples of the appointments starting in it,
+                    and the number of appointments in the view.
+
+    The tuple and lists of a state are never changed once published; every
+    change publishes a new state sharing all but the buckets it changed, so
+    a state returned by snapshot stays valid while the view changes.
+    """
+
+    def __init__(self):
+        """Initialize an empty CalendarView object."""
+        self._state = (((),) * BUCKETS, 0)
+
+    def __len__(self):
+        """Return the number of appointments in the view."""
+        return self._state[1]
+
+    def snapshot(self):
+        """Return the current state of the view."""
+        return self._state
+
+    def add(self, X):
+        """Place Appointment X in the view."""
+        self.update([], [X])
+
+    def remove(self, X):
+        """Remove Appointment X from the view if present."""
+        self.update([X], [])
+
+    def update(self, removed, added):
+        """
+        Publish a new state of the view without the Appointments in list
+        removed and with the Appointments in list added.
+
+        An Appointment replacing another of the same name must be preceded
+        by the removal of the other, which may sort elsewhere.
+        """
+        buckets, size = self._state
+        buckets = list(buckets)
+        copied = set()
+
+        def bucket_of(key):
+            """Return the bucket of key, copied on first change."""
+            index = _bucket(key)
+            if index not in copied:
+                buckets[index] = list(buckets[index])
+                copied.add(index)
+            return buckets[index]
+
+        for X in removed:
+            key = _sort_key(X)
+            bucket = bucket_of(key)
+            #(key,) sorts just before the entry of key, if there is one
+            n = bisect_left(bucket, (key,))
+            if n < len(bucket) and bucket[n][0] == key:
+                del bucket[n]
+                size -= 1
+
+        for X in added:
+            if not isinstance(X, Appointment):
+                raise TypeError("X must be of type Appointment.")
+
+            key = _sort_key(X)
+            bucket = bucket_of(key)
+            n = bisect_left(bucket, (key,))
+            if n < len(bucket) and bucket[n][0] == key:
+                bucket[n] = (key, X)
+            else:
+                bucket.insert(n, (key, X))
+                size += 1
+
+        self._state = (tuple(buckets), size)
+
+    def rebuild(self, calendar):
+        """Discard the view and rebuild it from dictionary calendar."""
+        buckets = [[] for i in range(BUCKETS)]
+        for X in calendar.itervalues():
+            key = _sort_key(X)
+            buckets[_bucket(key)].append((key, X))
+        for bucket in buckets:
+            bucket.sort(key=lambda entry: entry[0])
+        self._state = (tuple(buckets), sum(len(b) for b in buckets))
+
+    def iter_appointments(self, start=0, count=None, state=None):
+        """
+        Yield Appointment objects of state, or the current state, in sorted
+        order, skipping the first start and yielding at most count of them
+        when count is given.
+        """
+        buckets, size = state if state is not None else self._state
+        remaining = size if count is None else count
+
+        for bucket in buckets:
+            if remaining <= 0:
+                return
+            if start >= len(bucket):
+                start -= len(bucket)
+                continue
+
+            for key, X in bucket[start:start + remaining]:
+                yield X
+            remaining -= len(bucket) - start
+            start = 0
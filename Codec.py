@@ -0,0 +1,255 @@
+"""
+Message framing and compression for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+
+Every message is sent as a frame of a fixed header followed by its payload.
+The header holds the codec of the payload, the codecs the sending Node
+accepts, the sending and destination Node ids and the length of the payload,
+so one connection can carry frames for many Nodes; a Node only
+compresses for peers whose frames have advertised that they accept it.
+Control frames carry a bare control word, e.g. "terminate", rather than a
+pickled message.
+"""
+
+import struct
+import zlib
+import cPickle
+import cStringIO
+
+#codecs a frame payload may be encoded with, and the codec of control frames
+CODEC_RAW = "R"
+CODEC_ZLIB = "Z"
+CODEC_CONTROL = "C"
+
+#kinds of frame returned by FrameReader
+FRAME_DATA = "DATA"
+FRAME_CONTROL = "CONTROL"
+
+#bit flags advertised in every frame header for the codecs a Node accepts
+ACCEPT_ZLIB = 1
+ACCEPTS = ACCEPT_ZLIB
+
+#payloads smaller than this many bytes are never worth compressing
+COMPRESS_THRESHOLD = 4096
+COMPRESS_LEVEL = 6
+#bytes read from a socket at a time
+RECV_SIZE = 8192
+#size of the receive buffer of a FrameReader; it grows to fit a larger
+#uncompressed frame and shrinks back once that frame has been read
+BUFFER_SIZE = 64 * 1024
+#largest payload a frame may decode to; guards against hostile frames
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+#codec, accepted codecs, sender id, destination id, payload length
+_HEADER = struct.Struct("!cBiiI")
+
+
+class FrameWriter(object):
+    """
+    Writes frames to one connection.
+
+    sock:           connected socket frames are written to.
+    compressor:     zlib compression object shared by every compressed frame
+                    on this connection, so later frames reuse the history of
+                    earlier ones; created on first use.
+    """
+
+    def __init__(self, sock):
+        """Initialize a FrameWriter object for socket sock."""
+        self._sock = sock
+        self._compressor = None
+
+    def write(self, payload, sender, dest, compress=False):
+        """
+        Write string payload from Node sender to Node dest as one frame,
+        compressing it if compress is set and payload is at least
+        COMPRESS_THRESHOLD bytes.
+        """
+        if not isinstance(payload, str):
+            raise TypeError("payload must be of type string.")
+
+        if compress and len(payload) >= COMPRESS_THRESHOLD:
+            if self._compressor is None:
+                self._compressor = zlib.compressobj(COMPRESS_LEVEL)
+
+            #sync flush ends the frame on a byte boundary while keeping the
+            #compression history for the next frame on this connection
+            body = self._compressor.compress(payload)
+            body += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            codec = CODEC_ZLIB
+        else:
+            body = payload
+            codec = CODEC_RAW
+
+        header = _HEADER.pack(codec, ACCEPTS, sender, dest, len(body))
+        self._sock.sendall(header)
+        self._sock.sendall(body)
+
+    def write_control(self, word, sender, dest):
+        """Write control word word from Node sender to Node dest as a frame."""
+        if not isinstance(word, str):
+            raise TypeError("word must be of type string.")
+
+        header = _HEADER.pack(CODEC_CONTROL, ACCEPTS, sender, dest, len(word))
+        self._sock.sendall(header + word)
+
+
+class FrameReader(object):
+    """
+    Reads frames from one connection.
+
+    sock:           connected socket frames are read from.
+    buffer:         bytearray every frame is received into and decoded from
+                    in place; reused for the life of the connection.
+    start:          offset in buffer of the first byte not yet framed.
+    end:            offset in buffer one past the last byte received.
+    decompressor:   zlib decompression object mirroring the compressor of the
+                    FrameWriter at the other end of this connection.
+    inflating:      list of the sender id, destination id, accepted codecs,
+                    compressed bytes still to come, decompressed chunks and
+                    decompressed size of the compressed frame being read, or
+                    None between frames.
+
+    Uncompressed payloads are returned as read-only buffer objects over the
+    receive buffer rather than copies, so they are only valid until the
+    next call to fill or read_frame. Compressed payloads are decompressed
+    as their bytes arrive, so they never need to fit in the buffer.
+    """
+
+    def __init__(self, sock, size=BUFFER_SIZE):
+        """Initialize a FrameReader object for socket sock."""
+        self._sock = sock
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._decompressor = None
+        self._inflating = None
+
+    def _reserve(self, count):
+        """Make room in the buffer for a frame of count bytes at start."""
+        pending = self._end - self._start
+
+        if count > len(self._buffer):
+            #grow the buffer; it keeps its new size for later frames
+            size = max(count, 2 * len(self._buffer))
+            buffer = bytearray(size)
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        elif self._start + count > len(self._buffer):
+            #move the partial frame to the front of the buffer
+            self._buffer[:pending] = self._view[self._start:self._end]
+        else:
+            return
+
+        self._start, self._end = 0, pending
+
+    def fill(self):
+        """
+        Receive once from the connection into the buffer; return the number
+        of bytes received, 0 once the connection closes.
+        """
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buffer) > BUFFER_SIZE:
+                #give back the room a large frame needed
+                self._buffer = bytearray(BUFFER_SIZE)
+                self._view = memoryview(self._buffer)
+        elif self._end == len(self._buffer):
+            self._reserve(self._end - self._start + RECV_SIZE)
+
+        count = self._sock.recv_into(self._view[self._end:])
+        self._end += count
+        return count
+
+    def _inflate(self):
+        """
+        Decompress the buffered bytes of the compressed frame being read a
+        bounded chunk at a time, so a hostile frame can never inflate past
+        MAX_PAYLOAD; return the frame once all of its bytes have been, else
+        None.
+        """
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj()
+
+        frame = self._inflating
+        count = min(frame[3], self._end - self._start)
+        data = buffer(self._buffer, self._start, count)
+        self._start += count
+        frame[3] -= count
+
+        #a full chunk may leave more output pending even once data is used up
+        chunk = ""
+        while data or len(chunk) == RECV_SIZE:
+            chunk = self._decompressor.decompress(data, RECV_SIZE)
+            frame[5] += len(chunk)
+            if frame[5] > MAX_PAYLOAD:
+                raise ValueError("frame payload exceeds MAX_PAYLOAD.")
+            frame[4].append(chunk)
+            data = self._decompressor.unconsumed_tail
+
+        if frame[3]:
+            return None
+
+        self._inflating = None
+        sender, dest, accepts = frame[:3]
+        return (FRAME_DATA, sender, dest, accepts, "".join(frame[4]))
+
+    def next_frame(self):
+        """
+        Return the next complete frame already in the buffer as a 5-tuple of
+        its kind, the sender id, the destination id, the codecs the sender
+        accepts and the payload, or None if no complete frame is buffered.
+
+        The payload of a FRAME_CONTROL frame is its control word.
+        """
+        if self._inflating is not None:
+            return self._inflate()
+
+        if self._end - self._start < _HEADER.size:
+            return None
+
+        codec, accepts, sender, dest, length = _HEADER.unpack_from(
+            self._buffer, self._start)
+        if length > MAX_PAYLOAD:
+            raise ValueError("frame payload exceeds MAX_PAYLOAD.")
+
+        if codec == CODEC_ZLIB:
+            self._start += _HEADER.size
+            self._inflating = [sender, dest, accepts, length, [], 0]
+            return self._inflate()
+
+        count = _HEADER.size + length
+        if self._end - self._start < count:
+            self._reserve(count)
+            return None
+
+        body = buffer(self._buffer, self._start + _HEADER.size, length)
+        self._start += count
+
+        if codec == CODEC_RAW:
+            return (FRAME_DATA, sender, dest, accepts, body)
+        elif codec == CODEC_CONTROL:
+            return (FRAME_CONTROL, sender, dest, accepts, str(body))
+
+        raise ValueError("unknown frame codec " + repr(codec))
+
+    def read_frame(self):
+        """
+        Return the next frame as next_frame does, receiving until one is
+        complete, or None once the connection closes.
+        """
+        while True:
+            frame = self.next_frame()
+            if frame is not None:
+                return frame
+
+            if not self.fill():
+                if self._end != self._start or self._inflating is not None:
+                    raise IOError(
+                        "connection closed in the middle of a frame.")
+                return None
+
+def decode_payload(payload):
+    """Unpickle the message in payload, a string or buffer, without copying."""
+    return cPickle.load(cStringIO.StringIO(payload))
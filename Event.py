@@ -149,7 +149,7 @@ class Event(object):
 
     def __ne__(self, other):
         """Determine if two Event objects are not equal."""
-        return not __eq__(self, other)
+        return not self.__eq__(other)
 
     def __str__(self):
         """Create human-readable string representation of Event object."""
@@ -0,0 +1,336 @@
+"""
+Multi-tenant host for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+
+Runs many Nodes in one process behind a single listening socket. Frames are
+routed to hosted Nodes by their destination id, messages between hosted
+Nodes never leave memory, and one outbound connection is kept per remote
+host no matter how many of its Nodes are sent to.
+"""
+
+import sys
+import socket
+import pickle
+import random
+import select
+import threading
+import time
+from collections import deque
+from Codec import FrameReader, FrameWriter, ACCEPT_ZLIB, FRAME_CONTROL
+from Node import Node, ANTI_ENTROPY_INTERVAL, print_page, clear_console
+from Node import load_ids_to_IPs, membership_command, LISTEN_BACKLOG
+from Node import SEND_TIMEOUT, MSG_DIGEST, MSG_LOG
+from Outbox import Outbox
+
+
+class Host(object):
+    """
+    Host object.
+
+    address:        (IP, port) tuple the listening socket is bound to.
+    ids_to_IPs:     dictionary of form [Int: (String, Int)] of the address of
+                    every Node in the system, hosted here or not.
+    members_path:   path of the members file ids_to_IPs was read from.
+    nodes:          dictionary of form [Int: Node] of the Nodes hosted here.
+    peers:          dictionary of form [(String, Int): (Outbox, Thread)] of
+                    the messages pickled for each remote host and the sender
+                    thread holding the one outbound connection to it, so
+                    connecting never blocks the event loop; each outbox holds
+                    at most the newest message of each kind from each hosted
+                    Node to each of the host's Nodes.
+    readers:        dictionary of form [socket: FrameReader] of the inbound
+                    connections from remote hosts.
+    local:          deque of (sender, k, msg) 3-tuples of messages between
+                    hosted Nodes awaiting in-memory delivery.
+    """
+
+    def __init__(self, address, ids_to_IPs, members_path=None,
+            backlog=LISTEN_BACKLOG):
+        """Initialize a new Host object listening on address."""
+        if not isinstance(ids_to_IPs, dict):
+            raise TypeError("ids_to_IPs must be of type dictionary.")
+
+        self._address = address
+        self._ids_to_IPs = ids_to_IPs
+        self._members_path = members_path
+        self._nodes = {}
+        self._peers = {}
+        self._readers = {}
+        self._local = deque()
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(address)
+        self._listener.listen(backlog)
+
+    def add_node(self, N):
+        """Host Node N, routing all of its messages through this Host."""
+        if not isinstance(N, Node):
+            raise TypeError("N must be of type Node.")
+
+        N._transport = self
+        self._nodes[N._id] = N
+
+    def send(self, sender, k, msg, on_sent=None):
+        """
+        Send msg from hosted Node sender to Node k, then call on_sent, if
+        given, holding sender's lock; in memory if k is hosted here,
+        otherwise by the sender thread of k's host.
+
+        Messages to Nodes with no address, and those that can't be sent, are
+        dropped for anti-entropy to repair.
+        """
+        if k in self._nodes:
+            self._local.append((sender, k, msg))
+            if on_sent is not None:
+                on_sent()
+            return
+
+        address = self._ids_to_IPs.get(k)
+        if address is None:
+            return
+
+        address = tuple(address)
+        peer = self._peers.get(address)
+        if peer is None:
+            outbox = Outbox()
+            thread = threading.Thread(
+                target=self._run_sender, args=(address, outbox))
+            thread.daemon = True
+            thread.start()
+            peer = (outbox, thread)
+            self._peers[address] = peer
+
+        accepts = self._nodes[sender]._peer_accepts.get(k, 0)
+        kind = MSG_DIGEST if msg[0] == MSG_DIGEST else MSG_LOG
+        peer[0].put((sender, k, kind), (pickle.dumps(msg), sender, k,
+            bool(accepts & ACCEPT_ZLIB), on_sent))
+
+    def _run_sender(self, address, outbox):
+        """
+        Send the messages queued in outbox to the host at address until it
+        closes, over one connection kept open between them; the connection
+        is ended with a quit control frame.
+        """
+        peer = None
+        while True:
+            item = outbox.get()
+            if item is None:
+                break
+
+            payload, sender, k, compress, on_sent = item
+            #a kept connection the host has since closed fails once and is
+            #replaced
+            for attempt in range(2):
+                if peer is None:
+                    try:
+                        sock = socket.create_connection(address, SEND_TIMEOUT)
+                    except socket.error:
+                        break
+                    peer = (sock, FrameWriter(sock))
+
+                try:
+                    peer[1].write(payload, sender, k, compress)
+                except socket.error:
+                    peer[0].close()
+                    peer = None
+                    continue
+
+                if on_sent is not None:
+                    with self._nodes[sender]._lock:
+                        on_sent()
+                break
+
+        if peer is not None:
+            #the connection carries frames for many Nodes, so it is ended
+            #on behalf of none in particular
+            try:
+                peer[1].write_control("quit", -1, -1)
+            except socket.error:
+                pass
+            peer[0].close()
+
+    def _drain_local(self):
+        """Deliver every message queued between hosted Nodes."""
+        while self._local:
+            sender, k, msg = self._local.popleft()
+            self._nodes[k].deliver(msg)
+
+    def _close(self, conn):
+        """Stop reading from inbound connection conn."""
+        self._readers.pop(conn, None)
+        conn.close()
+
+    def _read(self, conn):
+        """
+        Receive once from readable connection conn and deliver every frame
+        completed to its destination; a partial frame waits for more data.
+        """
+        reader = self._readers[conn]
+        try:
+            received = reader.fill()
+        except socket.error:
+            received = 0
+
+        if not received:
+            self._close(conn)
+            return
+
+        while True:
+            try:
+                frame = reader.next_frame()
+            except ValueError:
+                self._close(conn)
+                return
+
+            if frame is None:
+                return
+
+            kind, sender, dest, accepts, data = frame
+            if kind == FRAME_CONTROL:
+                if data == "terminate" or data == "quit":
+                    self._close(conn)
+                    return
+                continue
+
+            N = self._nodes.get(dest)
+            if N is None:
+                print "[ERROR]: no Node " + str(dest) + " hosted here."
+                continue
+
+            N.learn_accepts(sender, accepts)
+            N.deliver(data)
+
+    def _anti_entropy(self):
+        """Send a digest from every hosted Node to a random peer."""
+        for N in self._nodes.values():
+            peers = [k for k in self._ids_to_IPs if k != N._id]
+            if not peers:
+                continue
+
+            N.send_digest(random.choice(peers))
+
+    def _handle_console(self, message):
+        """
+        Handle a console command, prefixed by the user it is for where it
+        concerns a single Node; return False once the Host should stop.
+        """
+        if message == "quit":
+            for N in self._nodes.values():
+                N._save_state()
+            return False
+        elif message == "clear":
+            clear_console()
+            return True
+        elif message.split(" ")[0] in ("join", "leave", "reload"):
+            try:
+                members = membership_command(
+                    message, self._ids_to_IPs, self._members_path)
+            except (IOError, ValueError) as e:
+                print "[ERROR]: could not reload members: " + str(e)
+                return True
+            if members is None:
+                print "[ERROR]: use 'join [id] [ip] [port]', 'leave [id]' or 'reload'"
+                return True
+
+            self._ids_to_IPs = members
+            for N in self._nodes.values():
+                N.update_membership(members)
+            return True
+
+        user, _, rest = message.partition(" ")
+        N = None
+        if user.startswith("user") and user[4:].isdigit():
+            N = self._nodes.get(int(user[4:]))
+
+        if N is None:
+            print "[ERROR]: commands must start with a user hosted here."
+        elif rest.split(" ")[0] in ("log", "calendar"):
+            print_page(N, rest)
+        elif rest == "print node":
+            sys.stdout.writelines(N.iter_node_lines())
+        else:
+            N.parse_command(message)
+
+        return True
+
+    def serve_forever(self):
+        """Run the event loop shared by every hosted Node until quit."""
+        next_round = time.time() + ANTI_ENTROPY_INTERVAL
+
+        while True:
+            self._drain_local()
+
+            timeout = max(0, next_round - time.time())
+            watched = [sys.stdin, self._listener] + self._readers.keys()
+            r, w, x = select.select(watched, [], [], timeout)
+
+            for ready in r:
+                if ready is sys.stdin:
+                    if not self._handle_console(raw_input('')):
+                        return
+                elif ready is self._listener:
+                    conn, addr = self._listener.accept()
+                    self._readers[conn] = FrameReader(conn)
+                else:
+                    self._read(ready)
+
+            if time.time() >= next_round:
+                self._anti_entropy()
+                next_round = time.time() + ANTI_ENTROPY_INTERVAL
+
+    def close(self):
+        """
+        Close the listening socket and every connection, telling remote
+        hosts with a quit control frame once the messages queued for them
+        are sent; waits up to SEND_TIMEOUT for them.
+        """
+        for conn in self._readers.keys():
+            self._close(conn)
+
+        peers, self._peers = self._peers.values(), {}
+        for outbox, thread in peers:
+            outbox.close()
+        deadline = time.time() + SEND_TIMEOUT
+        for outbox, thread in peers:
+            thread.join(max(0, deadline - time.time()))
+
+        self._listener.close()
+
+def main():
+    """
+    Host Nodes; usage is "python Host.py [members file] [port] [node id ...]".
+
+    Without node ids, every Node the members file places on port is hosted.
+    """
+    ids_to_IPs = load_ids_to_IPs(sys.argv[1])
+    PORT = int(sys.argv[2])
+
+    if len(sys.argv) > 3:
+        node_ids = [int(node_id) for node_id in sys.argv[3:]]
+    else:
+        node_ids = [k for k, (ip, port) in ids_to_IPs.items() if port == PORT]
+
+    H = Host(("0.0.0.0", PORT), ids_to_IPs, sys.argv[1])
+    node_count = max(ids_to_IPs.keys()) + 1
+
+    for node_id in node_ids:
+        #every Node tracks membership changes against its own copy
+        N = Node(
+            node_id=node_id, node_count=node_count,
+            ids_to_IPs=dict(ids_to_IPs))
+        N._state_path = "./state_" + str(node_id) + ".p"
+
+        #try to load a previous state of this Node
+        try:
+            N._load_state()
+        except IOError:
+            pass
+
+        H.add_node(N)
+
+    print("@> Host Started with " + str(len(node_ids)) + " Nodes")
+    H.serve_forever()
+    H.close()
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,60 @@ Node class for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
 import sys
 import socket
 import thread
+import threading
+from collections import namedtuple
+from itertools import islice
 from Event import Event
-from Appointment import Appointment, is_appointments_conflicting
+from Appointment import Appointment, is_appointments_conflicting, DAYS
+from Appointment import find_conflicting_pairs
+from Codec import FrameWriter, ACCEPT_ZLIB, FRAME_CONTROL
+from Codec import decode_payload
+from CalendarView import CalendarView
+from SharedDict import SharedDict
+from StateFile import MappedLog, load_state, save_state
+from ReceivePool import ReceivePool
+from Outbox import Outbox
+from SlotIndex import SlotIndex, SLOT_MINUTES, slot_to_time, appointment_mask
+
+#number of entries shown per page by the 'log [page]' and 'calendar [page]'
+#console commands
+PAGE_SIZE = 50
+
+#message kinds; a log message carries a partial log and 2DTT, a digest
+#carries only the sender's row of its 2DTT
+MSG_LOG = "LOG"
+MSG_DIGEST = "DIGEST"
+MSG_SNAPSHOT = "SNAPSHOT"
+
+#a snapshot of the calendar is sent in place of a partial log once the
+#partial log is both longer than the calendar and at least this long
+SNAPSHOT_MIN_EVENTS = 64
+#once more than this many logged events are retained only because some Node
+#has not learned of them, that Node is caught up by snapshot instead and
+#stops pinning the log; None retains events for every Node indefinitely
+MAX_RETAINED_LAG = 10000
+
+#a conflicting pair of appointments and which of the two was kept
+Conflict = namedtuple("Conflict", ["kept", "removed"])
+
+#immutable handle on one published version of a Node's calendar, log, clock
+#and 2DTT; the log is shared with later versions, which only ever append past
+#log_length, and T is a copy
+Snapshot = namedtuple("Snapshot",
+    ["version", "calendar", "view", "log", "log_length", "clock", "T"])
+
+#pending connections the listening socket queues before refusing more; while
+#the receive pool is full, connecting peers wait here
+LISTEN_BACKLOG = 128
+#seconds between checks for room in a full receive pool
+BACKPRESSURE_POLL = 0.05
+
+#seconds a connect to or send to a peer may block before it is given up on
+SEND_TIMEOUT = 5.0
+
+#seconds between anti-entropy rounds, each round is randomly jittered by up
+#to half as much again so Nodes don't synchronize their rounds
+ANTI_ENTROPY_INTERVAL = 5.0
 
 
 class Node(object):
@@ -17,8 +69,8 @@ class Node(object):
                     responsible for ensuring the id is unique.
     clock:          local clock of the Node enforced as an integer and
                     incremented whenever it is referenced.
-    calendar:       local calendar of events maintained as a dictionary
-                    data structure by this Node.
+    calendar:       local calendar of events maintained as a SharedDict
+                    mapping appointment names to Appointments by this Node.
     log:            local log of event records maintained by this Node.
     T:              this Node's 2D Time Table.
     node_count:     number of total Nodes in the distributed system enforced as
@@ -26,6 +78,43 @@ class Node(object):
     node_ID_to_IP   Dictionary of form [Int: (String1, String2)], containing
                     the NodeIDs to IP address relationship of all nodes in
                     system. String1 is the IP while String2 is the port number                
+    view:           CalendarView of the local calendar sorted by day, start
+                    time and participants, used for all console output.
+    peer_accepts:   dictionary of form [Int: Int] mapping node ids to the
+                    codec flags their frames last advertised; peers not in
+                    it are only ever sent uncompressed frames.
+    state_path:     path of the file this Node's state is saved to on fail.
+    transport:      object whose send(sender, k, msg, on_sent) delivers
+                    messages on behalf of this Node, e.g. a Host; None to
+                    connect to Node k directly.
+    outboxes:       dictionary of form [Int: Outbox] of the messages pickled
+                    for each node id awaiting its sender thread, used when
+                    there is no transport; each holds at most the newest
+                    digest and the newest partial log or snapshot, and each
+                    sender thread keeps one connection open to its Node.
+    senders:        dictionary of form [Int: Thread] of the sender thread of
+                    each outbox.
+    lock:           reentrant lock held while this Node's state is changed by
+                    a receive or console command.
+    published:      Snapshot of the calendar, log, clock and 2DTT most
+                    recently published by a writer; readers use it without
+                    taking the lock.
+    departed:       set of ids of Nodes that have left the system but still
+                    have a row and column in T; they pin no events in the
+                    log.
+    stale:          set of node ids whose missing events may have been
+                    discarded from the log; they are sent a snapshot next.
+    slots:          SlotIndex of the occupied half hour slots of every
+                    participant on every day of the local calendar.
+    origins:        dictionary of form [String: (Int, Int)] mapping the name
+                    of each appointment in the calendar to the node id and
+                    time of the INSERT event that created it, where known;
+                    kept once the event has left the log so snapshots can
+                    credit every appointment to its actual origin.
+
+    The calendar is a SharedDict, changed only by replacing it with a new
+    version, and the log list is only ever appended to or replaced, so a
+    published Snapshot never changes.
 
     Node ID's are assumed to start at 0.
     """
@@ -45,43 +134,93 @@ class Node(object):
 
         self._id = node_id
         self._clock = 0
-        self._calendar = {}
-        self._log = []
+        self._calendar = SharedDict()
+        self._log = MappedLog()
         self._T = [[0 for j in range(node_count)] for i in range(node_count)]
         self._node_count = node_count
         self._ids_to_IPs = ids_to_IPs
+        self._view = CalendarView()
+        self._slots = SlotIndex()
+        self._origins = {}
+        self._peer_accepts = {}
+        self._stale = set()
+        self._departed = set()
+        self._max_lag = MAX_RETAINED_LAG
+        self._state_path = "./state.p"
+        self._transport = None
+        self._outboxes = {}
+        self._senders = {}
+        self._lock = threading.RLock()
+        self._version = 0
+        self._publish()
     
     def __str__(self):
         """Human readable string of this Node."""
-        hr_str = ""
-        hr_str += "ID:" + str(self._id) + '\n'
-        hr_str += "CLOCK: " + str(self._clock) + '\n'
-        hr_str += "CALENDAR:\n"
-        for k,v in self._calendar.iteritems():
-            hr_str += "\tAPPOINTMENT:" + k + '\n'
-        hr_str += "LOG:\n"
-        for eR in self._log:
-            hr_str += '\t' + str(eR) + '\n'
-
-        hr_str += "TIME TABLE:\n"
-        for row in self._T:
-            hr_str += '\t' + str(row) + '\n'
-
-        return hr_str
+        return "".join(self.iter_node_lines())
+
+    def _publish(self):
+        """Publish the current calendar, log, clock and 2DTT as a Snapshot."""
+        self._version += 1
+        self._published = Snapshot(
+            version=self._version, calendar=self._calendar,
+            view=self._view.snapshot(), log=self._log,
+            log_length=len(self._log), clock=self._clock,
+            T=[list(row) for row in self._T])
+
+    def snapshot(self):
+        """
+        Return the most recently published Snapshot of this Node's calendar,
+        log, clock and 2DTT; it never changes, however this Node changes after.
+        """
+        return self._published
+
+    def iter_node_lines(self):
+        """Yield the lines of the human readable string of this Node."""
+        snapshot = self.snapshot()
+        yield "ID:" + str(self._id) + '\n'
+        yield "CLOCK: " + str(snapshot.clock) + '\n'
+        yield "CALENDAR:\n"
+        for X in self._view.iter_appointments(state=snapshot.view):
+            yield "\tAPPOINTMENT:" + X._name + '\n'
+        yield "LOG:\n"
+        for eR in islice(snapshot.log, snapshot.log_length):
+            yield '\t' + str(eR) + '\n'
+
+        yield "TIME TABLE:\n"
+        for row in snapshot.T:
+            yield '\t' + str(row) + '\n'
     
-    def print_log(self):
-        """Print log of this Node object."""
-        hr_str = "LOG:\n"
-        for eR in self._log:
-            hr_str += '\t' + str(eR) + '\n'
-        return hr_str
-
-    def print_calendar(self):
-        """Print calendar of this Node object."""
-        hr_str = "CALENDAR:\n"
-        for k,v in self._calendar.iteritems():
-            hr_str += str(v) + '\n'
-        return hr_str
+    def print_log(self, start=0, count=None):
+        """
+        Print log of this Node object, optionally only the count entries
+        following the first start entries.
+        """
+        return "".join(self.iter_log_lines(start, count))
+
+    def iter_log_lines(self, start=0, count=None):
+        """Yield the lines of the printed log of this Node object."""
+        snapshot = self.snapshot()
+        stop = snapshot.log_length
+        if count is not None:
+            stop = min(stop, start + count)
+        yield "LOG:\n"
+        for eR in islice(snapshot.log, start, max(start, stop)):
+            yield '\t' + str(eR) + '\n'
+
+    def print_calendar(self, start=0, count=None):
+        """
+        Print calendar of this Node object sorted by day, start time and
+        participants, optionally only the count appointments following the
+        first start appointments.
+        """
+        return "".join(self.iter_calendar_lines(start, count))
+
+    def iter_calendar_lines(self, start=0, count=None):
+        """Yield the lines of the printed calendar of this Node object."""
+        snapshot = self.snapshot()
+        yield "CALENDAR:\n"
+        for X in self._view.iter_appointments(start, count, snapshot.view):
+            yield str(X) + '\n'
 
     def hasRec(self, eR, k):
         """
@@ -112,6 +251,10 @@ class Node(object):
         if other_calendar:
             calendar = other_calendar
         else:
+            #no participant has any of X's slots occupied, nothing to scan
+            occupied = self._slots.occupancy(X._participants, X._day)
+            if not occupied & appointment_mask(X):
+                return False
             calendar = self._calendar
 
         #for each appointment in the calendar
@@ -155,25 +298,233 @@ class Node(object):
 
         return False
 
+    def _calendar_add(self, X):
+        """
+        Publish a version of the local calendar with Appointment X placed in
+        it, updating its indexes.
+        """
+        previous = self._calendar.get(X._name)
+        if previous is not None:
+            self._slots.remove(previous)
+
+        self._calendar = self._calendar.set(X._name, X)
+        self._view.update([previous] if previous is not None else [], [X])
+        self._slots.add(X)
+        self._publish()
+
+    def _calendar_remove(self, name):
+        """
+        Publish a version of the local calendar without the Appointment named
+        name, updating its indexes.
+        """
+        X = self._calendar.get(name)
+        if X is None:
+            return
+
+        self._calendar = self._calendar.remove(name)
+        self._origins.pop(name, None)
+        self._view.remove(X)
+        self._slots.remove(X)
+        self._publish()
+
+    def _set_calendar(self, calendar):
+        """
+        Publish dictionary calendar as the local calendar, updating the
+        indexes only for the appointments that actually changed.
+        """
+        removed = [X for name, X in self._calendar.iteritems()
+            if calendar.get(name) is not X]
+        added = [X for name, X in calendar.iteritems()
+            if self._calendar.get(name) is not X]
+
+        for X in removed:
+            self._slots.remove(X)
+            if X._name not in calendar:
+                self._origins.pop(X._name, None)
+        for X in added:
+            self._slots.add(X)
+
+        self._calendar = SharedDict(calendar)
+        self._view.update(removed, added)
+        self._publish()
+
+    def find_free_windows(self, participants, day, duration):
+        """
+        Return a list of (start, end) time tuples of every maximal window on
+        day of at least duration minutes free for all of participants.
+        """
+        if duration % SLOT_MINUTES != 0:
+            raise ValueError(
+                "duration must be a multiple of " + str(SLOT_MINUTES) +
+                " minutes.")
+
+        windows = self._slots.free_windows(
+            participants, day, duration // SLOT_MINUTES)
+        return [(slot_to_time(s), slot_to_time(e)) for s, e in windows]
+
+    def find_earliest_window(self, participants, day, duration):
+        """
+        Return the earliest (start, end) time tuple of a window of duration
+        minutes on day free for all of participants, or None if none exists.
+        """
+        if duration % SLOT_MINUTES != 0:
+            raise ValueError(
+                "duration must be a multiple of " + str(SLOT_MINUTES) +
+                " minutes.")
+
+        window = self._slots.earliest_window(
+            participants, day, duration // SLOT_MINUTES)
+        if window is None:
+            return None
+
+        return (slot_to_time(window[0]), slot_to_time(window[1]))
+
+    def _resize(self, node_count):
+        """Grow or shrink the 2DTT in place to node_count rows and columns."""
+        for row in self._T:
+            if len(row) < node_count:
+                row.extend([0] * (node_count - len(row)))
+            else:
+                del row[node_count:]
+
+        while len(self._T) < node_count:
+            self._T.append([0] * node_count)
+        del self._T[node_count:]
+
+        self._node_count = node_count
+
+    def _grow(self, node_count):
+        """
+        Grow the 2DTT to at least node_count rows and columns; new ids this
+        Node has no address for are treated as departed.
+        """
+        if node_count <= self._node_count:
+            return
+
+        for j in range(self._node_count, node_count):
+            if j not in self._ids_to_IPs:
+                self._departed.add(j)
+        self._resize(node_count)
+
+    def join(self, node_id, ip, port):
+        """Add Node node_id at (ip, port) to the system."""
+        if not isinstance(node_id, int):
+            raise TypeError("node_id parameter must be of type int.")
+
+        self._ids_to_IPs[node_id] = (ip, port)
+        self._departed.discard(node_id)
+        self._grow(node_id + 1)
+        self._publish()
+
+    def leave(self, node_id):
+        """
+        Remove Node node_id from the system; it no longer pins events in the
+        log, and trailing departed Nodes no logged event originates at are
+        dropped from the 2DTT.
+        """
+        if not isinstance(node_id, int):
+            raise TypeError("node_id parameter must be of type int.")
+        if node_id == self._id:
+            raise ValueError("a Node can not remove itself from the system.")
+
+        self._ids_to_IPs.pop(node_id, None)
+        outbox = self._outboxes.pop(node_id, None)
+        if outbox is not None:
+            outbox.close()
+            self._senders.pop(node_id, None)
+        self._stale.discard(node_id)
+        self._peer_accepts.pop(node_id, None)
+        if node_id < self._node_count:
+            self._departed.add(node_id)
+
+        origins = set(meta[0] for n, meta in self._log.iter_meta())
+        n = self._node_count
+        while n - 1 in self._departed and n - 1 not in origins:
+            n -= 1
+            self._departed.discard(n)
+
+        if n < self._node_count:
+            self._resize(n)
+        self._publish()
+
+    def update_membership(self, ids_to_IPs):
+        """Join and leave Nodes so the system matches dictionary ids_to_IPs."""
+        for k in self._ids_to_IPs.keys():
+            if k not in ids_to_IPs and k != self._id:
+                self.leave(k)
+
+        for k, ip_port in ids_to_IPs.iteritems():
+            if self._ids_to_IPs.get(k) != tuple(ip_port):
+                self.join(k, ip_port[0], ip_port[1])
+
     def _handle_conflict(self, X):
         """Execute conflict resolution protocol."""
         self.delete(X)
 
     def _load_state(self):
-        """Load a previous state of this Node."""
-        import pickle
-        N = pickle.load( open( "state.p", "rb" ) )
-        self._id = N._id
-        self._clock = N._clock
-        self._calendar = N._calendar
-        self._log = N._log
-        self._T = N._T
-        self._node_count = N._node_count
+        """
+        Load a previous state of this Node.
+
+        Only the index of the state file is read; logged events are paged in
+        from the memory-mapped file as they're used. State pickled whole by
+        earlier versions is still loaded.
+        """
+        try:
+            state = load_state(self._state_path)
+        except ValueError:
+            import pickle
+            N = pickle.load( open( self._state_path, "rb" ) )
+            log = MappedLog()
+            for eR in N._log:
+                log.append(eR)
+            state = {
+                "id": N._id, "clock": N._clock, "calendar": N._calendar,
+                "log": log, "T": N._T, "node_count": N._node_count,
+                "stale": getattr(N, "_stale", set()), "departed": set()}
+
+        self._id = state["id"]
+        self._clock = state["clock"]
+        self._calendar = SharedDict(state["calendar"])
+        self._log = state["log"]
+        self._T = state["T"]
+        self._node_count = state["node_count"]
+        self._stale = state["stale"]
+        #state files saved before membership changes have no departed Nodes
+        self._departed = state.get("departed", set())
+        #members may have joined while this Node was down
+        if self._ids_to_IPs:
+            self._grow(max(self._ids_to_IPs) + 1)
+        self._view.rebuild(self._calendar)
+        self._slots.rebuild(self._calendar)
+        if "origins" in state:
+            self._origins = state["origins"]
+        else:
+            #origins of the appointments whose insert is still logged
+            self._origins = {}
+            for n, (node_id, time, op, name) in self._log.iter_meta():
+                if op == "INSERT" and name in self._calendar:
+                    self._origins[name] = (node_id, time)
+        self._publish()
 
     def _save_state(self):
-        """Save this Node's state to state.txt in cwd."""
-        import pickle
-        pickle.dump( self, open( "./state.p", "wb" ) )
+        """Save this Node's state to state_path."""
+        index = {
+            "id": self._id, "clock": self._clock,
+            "calendar": dict(self._calendar.iteritems()), "T": self._T,
+            "node_count": self._node_count,
+            "stale": self._stale, "departed": self._departed,
+            "origins": self._origins}
+        save_state(self._state_path, index, self._log)
+
+    def __getstate__(self):
+        """Return the state of this Node to pickle, less its transport."""
+        state = dict(self.__dict__)
+        state.pop("_transport", None)
+        state.pop("_outboxes", None)
+        state.pop("_senders", None)
+        state.pop("_lock", None)
+        state.pop("_published", None)
+        return state
 
     def insert(self, X):
         """Insert Appointment X into this Node's local calendar and log."""
@@ -206,7 +557,8 @@ class Node(object):
 
             #add appointment to calendar using appointment name as key as
             #we have assumed unique names for appointments.
-            self._calendar[X._name] = X
+            self._calendar_add(X)
+            self._origins[X._name] = (i, self._clock)
 
             #for every user in the participant list of scheduled Appointment X
             for user in X._participants:
@@ -257,12 +609,12 @@ class Node(object):
             if e not in self._log:
                 self._log.append(e)
 
-            #add appointment to calendar using appointment name as key as
-            #we have assumed unique names for appointments.
-            self._calendar.pop(X._name, None)
+            #remove appointment from calendar using appointment name as key
+            #as we have assumed unique names for appointments.
+            self._calendar_remove(appt._name)
 
-            #for every user in the participant list of scheduled Appointment X
-            for user in X._participants:
+            #for every user in the participant list of canceled Appointment
+            for user in appt._participants:
                 #if the user is not this Node, propogate canceled Appointment
                 if user != i:
                     try:
@@ -271,61 +623,348 @@ class Node(object):
                         pass
 
     def send(self, k):
-        """Build partial log and send to node with node_id k."""
-        import copy
+        """
+        Build partial log and send to node with node_id k, or a snapshot of
+        the calendar if that is smaller or k may be missing discarded events.
+        """
         #construct partial log of events to send to Node k
-        NP = [eR for eR in self._log if not self.hasRec(eR, k)]
-        msg = (NP, copy.deepcopy(self._T), self._id)
+        self._send_partial(k, self._missing(self._T[k]))
 
-        #do send of actual msg via TCP
-        ip_port_K = self._ids_to_IPs[k]
+    def _missing(self, row):
+        """
+        Return the list of log indexes of the events that row, a row of a
+        2DTT, shows have not been learned of; no events of Nodes beyond the
+        end of row have been. No event is paged in to decide.
+        """
+        return [n for n, (node_id, time, op, name) in self._log.iter_meta()
+            if node_id >= len(row) or time > row[node_id]]
 
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((ip_port_K[0], ip_port_K[1]))
+    def _send_partial(self, k, missing):
+        """
+        Send the partial log of the events at list missing of log indexes to
+        node k, or a snapshot of the calendar in its place if that is
+        smaller or k may be missing discarded events.
+        """
+        lagging = (len(missing) >= SNAPSHOT_MIN_EVENTS
+            and len(missing) > len(self._calendar))
+        if k in self._stale or lagging:
+            self._send_snapshot(k, missing)
+        else:
+            self._send_log(k, [self._log[n] for n in missing])
 
-        #pickle message and send
+    def _send_snapshot(self, k, missing):
+        """
+        Send the calendar, the origin of each of its appointments and the
+        2DTT to node k in place of the events at list missing of log indexes.
+
+        Only those events that some other Node is not known to have are
+        included, so that k can pass them on; k learns the rest through the
+        calendar itself.
+        """
+        import copy
+        others = [j for j in range(self._node_count)
+            if j != k and j not in self._departed]
+        NP = []
+        for n in missing:
+            node_id, time = self._log.meta(n)[:2]
+            if any(self._T[j][node_id] < time for j in others):
+                NP.append(self._log[n])
+
+        msg = (MSG_SNAPSHOT, self._calendar.values(), dict(self._origins),
+               NP, copy.deepcopy(self._T), self._id)
+
+        #once it is sent k has everything this Node knows of
+        self._send_message(k, msg, lambda: self._stale.discard(k))
+
+    def send_digest(self, k):
+        """
+        Send this Node's row of its 2DTT to node with node_id k, asking k to
+        reply with exactly the events the row shows this Node is missing.
+        """
+        self._send_message(k, (MSG_DIGEST, list(self._T[self._id]), self._id))
+
+    def _send_log(self, k, NP):
+        """Send partial log NP along with this Node's 2DTT to node k."""
+        import copy
+        self._send_message(k, (MSG_LOG, NP, copy.deepcopy(self._T), self._id))
+
+    def _send_message(self, k, msg, on_sent=None):
+        """
+        Pickle msg and send it to node with node_id k via TCP, then call
+        on_sent, if given, holding the lock.
+
+        msg is pickled right away but sent by k's sender thread, so no lock
+        is held while connecting; it replaces any message of its kind still
+        waiting for k, a newer partial log or snapshot superseding an older
+        one. A message that can't be sent is dropped for anti-entropy to
+        repair.
+        """
+        if self._transport is not None:
+            self._transport.send(self._id, k, msg, on_sent)
+            return
+
+        #pickle message, compressed if Node k has said it accepts it
         import pickle
         message = pickle.dumps(msg)
-        sock.send(message)
-        sock.close()
+        compress = bool(self._peer_accepts.get(k, 0) & ACCEPT_ZLIB)
+
+        with self._lock:
+            outbox = self._outboxes.get(k)
+            if outbox is None:
+                outbox = Outbox()
+                sender = threading.Thread(
+                    target=self._run_sender, args=(k, outbox))
+                sender.daemon = True
+                sender.start()
+                self._outboxes[k] = outbox
+                self._senders[k] = sender
+        key = MSG_DIGEST if msg[0] == MSG_DIGEST else MSG_LOG
+        outbox.put(key, (message, compress, on_sent))
+
+    def _run_sender(self, k, outbox):
+        """
+        Send the messages queued in outbox to node k until it closes, over one
+        connection kept open between them so compressed frames reuse the
+        history of earlier ones; the connection is ended with a quit control
+        frame.
+        """
+        peer = None
+        while True:
+            item = outbox.get()
+            if item is None:
+                break
+
+            message, compress, on_sent = item
+            #a kept connection k has since closed fails once and is replaced
+            for attempt in range(2):
+                if peer is None:
+                    peer = self._connect(k)
+                    if peer is None:
+                        break
+
+                try:
+                    peer[1].write(message, self._id, k, compress)
+                except socket.error:
+                    peer[0].close()
+                    peer = None
+                    continue
+
+                if on_sent is not None:
+                    with self._lock:
+                        on_sent()
+                break
+
+        if peer is not None:
+            try:
+                peer[1].write_control("quit", self._id, k)
+            except socket.error:
+                pass
+            peer[0].close()
+
+    def close(self):
+        """
+        Stop every sender thread once the messages queued before it are
+        sent, waiting up to SEND_TIMEOUT for them; must be called without
+        holding the lock.
+        """
+        import time
+
+        with self._lock:
+            outboxes, self._outboxes = self._outboxes, {}
+            senders, self._senders = self._senders, {}
+
+        for outbox in outboxes.values():
+            outbox.close()
+
+        deadline = time.time() + SEND_TIMEOUT
+        for sender in senders.values():
+            sender.join(max(0, deadline - time.time()))
+
+    def _connect(self, k):
+        """
+        Return a (socket, FrameWriter) tuple of a new connection to node k,
+        or None if k can't be reached.
+        """
+        ip_port_K = self._ids_to_IPs.get(k)
+        if ip_port_K is None:
+            return None
+
+        try:
+            sock = socket.create_connection(
+                (ip_port_K[0], ip_port_K[1]), SEND_TIMEOUT)
+        except socket.error:
+            return None
+        return (sock, FrameWriter(sock))
+
+    def learn_accepts(self, k, accepts):
+        """Record the codec flags advertised by a frame from Node k."""
+        self._peer_accepts[k] = accepts
+
+    def _answer_digest(self, row, k):
+        """
+        Reply to the digest row of Node k with the events in this Node's log
+        that row shows k has not learned of, or with a snapshot as send does.
+        """
+        self._grow(max(k + 1, len(row)))
+
+        #row is k's direct knowledge, so it is safe to learn it outright
+        for J in range(len(row)):
+            self._T[k][J] = max(self._T[k][J], row[J])
+        self._publish()
+
+        missing = self._missing(row)
+        if missing or k in self._stale:
+            self._send_partial(k, missing)
 
     def receive(self, message):
-        """Receive messages over TCP."""
+        """
+        Receive messages over TCP.
 
-        #unpickle message
-        import pickle
-        m = pickle.loads(message)
+        Return the list of events this Node learned of; digest messages are
+        answered directly and teach this Node no events.
+        """
 
-        #set i and n for name convenience
-        i, n = self._id, self._node_count
+        #unpickle message unless it was delivered in memory
+        if isinstance(message, (str, buffer)):
+            m = decode_payload(message)
+        else:
+            m = message
+
+        if m[0] == MSG_DIGEST:
+            self._answer_digest(m[1], m[2])
+            return []
+
+        if m[0] == MSG_SNAPSHOT:
+            return self._receive_snapshot(*m[1:])
 
         #pull partial log, 2DTT and sender id k from message m
-        NPk, Tk, k = m
+        NPk, Tk, k = m[1:]
+        #Node k may know of Nodes this Node does not
+        self._grow(len(Tk))
 
         #get list of events this Node doesn't know about
-        NE = [fR for fR in NPk if not self.hasRec(fR, i)]
+        NE = [fR for fR in NPk if not self.hasRec(fR, self._id)]
 
         #get list of Appointments within this Node's calendar and the
         #Appointments from the NE list
         Vi = list(
             set(self._calendar.values() + [cvR._op_params for cvR in NE]))
 
-        filtered_Vi = []
-
         #filter out deleted Appointments
-        for v in Vi:
-            for dR in NE:
-                if dR._op == r"DELETE" and dR._op_params == v:
-                    break
-            else:
-                filtered_Vi.append(v)
+        deleted = _by_name(dR._op_params for dR in NE if dR._op == r"DELETE")
+        filtered_Vi = [v for v in Vi if not _holds(deleted, v)]
 
         #list of appointments which will become this Node's new dict
         Vi = filtered_Vi
         #rewrite dictionary with valid appointments only
-        self._calendar = {}
+        calendar = {}
         for v in Vi:
-            self._calendar[v._name] = v
+            calendar[v._name] = v
+        self._set_calendar(calendar)
+        self._learn_origins(NE)
+
+        self._merge_time_table(Tk, k)
+        self._collect_log(NE)
+
+        return NE
+
+    def _learn_origins(self, events):
+        """
+        Record the origin of every appointment of the calendar inserted by
+        an INSERT event in list events.
+        """
+        for eR in events:
+            if eR._op == "INSERT" and _has_appointment(
+                    self._calendar, eR._op_params):
+                self._origins[eR._op_params._name] = (eR._node_id, eR._time)
+
+    def _receive_snapshot(self, snapshot, origins, NPk, Tk, k):
+        """
+        Merge the calendar snapshot of Node k into this Node's calendar.
+
+        An appointment only in the snapshot is added unless this Node has
+        logged its deletion; an appointment only in this Node's calendar is
+        kept if k had not learned of its insertion, or if k may be missing
+        events this Node has already discarded.
+
+        Return the events this Node learned of, followed by an INSERT event
+        for every appointment the snapshot added whose insertion is not among
+        them, so deliver checks it for conflicts. The INSERT is the one sent
+        along with the snapshot if there is one, else it is rebuilt from the
+        origin k sent in dictionary origins, so every Node ranks the
+        appointment alike; it is credited to k at its own time only when k
+        knows no origin for it.
+        """
+        i = self._id
+        self._grow(len(Tk))
+
+        NE = [fR for fR in NPk if not self.hasRec(fR, i)]
+
+        #log indexes of the deletes and of the inserts k had not learned of
+        #by appointment name, so each lookup pages in only same-named events;
+        #k knows of no Nodes beyond the end of its row
+        unknown_to_k = set(self._missing(Tk[k]))
+        deleted = {}
+        inserted = {}
+        for n, (node_id, time, op, name) in self._log.iter_meta():
+            if op == r"DELETE":
+                deleted.setdefault(name, []).append(n)
+            elif op == "INSERT" and n in unknown_to_k:
+                inserted.setdefault(name, []).append(n)
+
+        calendar = {}
+        for v in snapshot:
+            if v._name in self._calendar or not self._logs(deleted, v):
+                calendar[v._name] = v
+
+        for name, v in self._calendar.iteritems():
+            if name in calendar:
+                continue
+            if k in self._stale or self._logs(inserted, v):
+                calendar[name] = v
+
+        #appointments only in the snapshot; deliver checks their conflicts
+        learned = _by_name(fR._op_params for fR in NE if fR._op == "INSERT")
+        added = [v for v in snapshot if calendar.get(v._name) is v
+            and not _has_appointment(self._calendar, v)
+            and not _holds(learned, v)]
+        inserts = dict((eR._op_params._name, eR) for eR in NPk
+            if eR._op == "INSERT")
+
+        self._set_calendar(calendar)
+        self._learn_origins(NE)
+
+        self._merge_time_table(Tk, k)
+        self._collect_log(NE)
+
+        for v in added:
+            eR = inserts.get(v._name)
+            if eR is None or not eR._op_params == v:
+                node_id, time = origins.get(v._name, (k, Tk[k][k]))
+                eR = Event(
+                    op="INSERT", time=time, node_id=node_id, op_params=v)
+            self._origins[v._name] = (eR._node_id, eR._time)
+            NE.append(eR)
+
+        return NE
+
+    def _logs(self, indexes, X):
+        """
+        Determine if an event at the log indexes that dictionary indexes maps
+        the name of Appointment X to is of X.
+        """
+        for n in indexes.get(X._name, ()):
+            if self._log[n]._op_params == X:
+                return True
+        return False
+
+    def _merge_time_table(self, Tk, k):
+        """Extract direct and indirect knowledge from Node k's 2DTT Tk."""
+        #Node k may know of Nodes this Node does not, or the other way round
+        self._grow(len(Tk))
+
+        #set i and n for name convenience
+        i, n = self._id, len(Tk)
 
         #extract direct knowledge from Node k's 2DTT
         for I in range(n):
@@ -336,20 +975,133 @@ class Node(object):
             for J in range(n):
                 self._T[I][J] = max(self._T[I][J], Tk[I][J])
 
-        #create new log and union of this Node's log and NE list
-        new_log = []
-        PLiUNE = list(set(list(self._log) + NE))
+    def _collect_log(self, NE):
+        """
+        Replace the log with the union of the log and the NE list, discarding
+        every event all Nodes are known to have learned of.
+
+        Nodes missing more than max_lag of the events are marked stale and no
+        longer keep events in the log; they are sent a snapshot instead.
+        Departed Nodes keep no events in the log.
+        """
+        n, T = self._node_count, self._T
+
+        #origin and time of the events of this Node's log then the NE list;
+        #NE holds only events this Node's log doesn't, so this is their union
+        #and no logged event is paged in
+        stamps = [meta[:2] for i, meta in self._log.iter_meta()]
+        stamps += [(eR._node_id, eR._time) for eR in NE]
+
+        if self._max_lag is not None:
+            for j in range(n):
+                if j == self._id or j in self._stale or j in self._departed:
+                    continue
+                missing = sum(1 for node_id, time in stamps
+                    if T[j][node_id] < time)
+                if missing > self._max_lag:
+                    self._stale.add(j)
+
+        tracked = [j for j in range(n)
+            if j not in self._stale and j not in self._departed]
+
         #if there is some Node j for which this Node knows j does not know of
         #all events up to time eR.time, we can't discard it, keep it in the log
-        for eR in PLiUNE:
-            for j in range(n):
-                if not self.hasRec(eR, j):
-                    new_log.append(eR)
-                    break
+        kept = [m for m, (node_id, time) in enumerate(stamps)
+            if any(T[j][node_id] < time for j in tracked)]
+
+        logged = len(self._log)
+        new_log = self._log.select([m for m in kept if m < logged])
+        for m in kept:
+            if m >= logged:
+                new_log.append(NE[m - logged])
 
         self._log = new_log
+        self._publish()
 
-        return NE
+    def deliver(self, message):
+        """
+        Receive message and resolve the conflicts it introduces; return the
+        conflict report of resolve_conflicts.
+
+        Deliveries are serialized by this Node's lock.
+        """
+        with self._lock:
+            #hold the calendar before receiving data i.e. redefining this
+            #Node's calendar; it is never changed in place so it won't change
+            pre_dict = self.snapshot().calendar
+            NE = self.receive(message)
+            #Get the appointments in new dictionary not in old dictionary that
+            #aren't deletes; names are unique so lookups by name suffice
+            new_entries = [event for event in NE if event._op != r"DELETE"]
+            new_entries = [event for event in new_entries
+                if not _has_appointment(pre_dict, event._op_params)
+                and _has_appointment(self._calendar, event._op_params)]
+
+            report = self.resolve_conflicts(pre_dict, new_entries)
+            for conflict in report:
+                self._handle_conflict(conflict.removed)
+
+            return report
+
+    def resolve_conflicts(self, calendar, new_entries):
+        """
+        Return the conflict report of the INSERT events in new_entries
+        against the Appointments of dictionary calendar still in this Node's
+        calendar; a list of Conflict tuples, one for every conflicting pair,
+        in a deterministic order.
+
+        Of each pair the Appointment whose insertion this Node learned of
+        from the Node it has the older direct knowledge of is kept, as is an
+        Appointment whose insertion has already left the log; ties are broken
+        by creating Node id, then event time, then name. Once an Appointment
+        is removed its remaining pairs are not reported.
+        """
+        if not new_entries:
+            return []
+
+        i = self._id
+
+        #map each appointment name to the insert event that created it; only
+        #the logged events of appointments that are ranked are paged in
+        logged = dict((name, n) for n, (node_id, time, op, name)
+            in self._log.iter_meta() if op == "INSERT")
+        insert_events = {}
+        for event in new_entries:
+            insert_events[event._op_params._name] = event
+
+        def rank(X):
+            """Return the key ordering X before the Appointments it beats."""
+            event = insert_events.get(X._name)
+            if event is None and X._name in logged:
+                event = self._log[logged[X._name]]
+            if event is None or not event._op_params == X:
+                return (-1, -1, -1, X._name)
+            return (self._T[i][event._node_id], event._node_id, event._time,
+                    X._name)
+
+        #appointments the same receive deleted no longer conflict with anything
+        existing = [X for X in calendar.itervalues()
+            if _has_appointment(self._calendar, X)]
+        new_appts = [event._op_params for event in new_entries]
+        pairs = [(new_appts[n], original_appt)
+            for n, original_appt in find_conflicts(existing, new_appts)]
+        pairs.sort(key=lambda pair: (rank(pair[0]), rank(pair[1])))
+
+        report = []
+        removed = set()
+        for new_appt, original_appt in pairs:
+            if new_appt._name in removed or original_appt._name in removed:
+                continue
+
+            if rank(original_appt) < rank(new_appt):
+                kept, loser = original_appt, new_appt
+            else:
+                kept, loser = new_appt, original_appt
+
+            removed.add(loser._name)
+            report.append(Conflict(kept=kept, removed=loser))
+
+        return report
 
     def parse_command(self, cmd):
         """
@@ -360,6 +1112,10 @@ class Node(object):
 
         [user assigning action] [appointment_type] [appointment_name] [ ( tuple of users appointment is for) ] [ (startTime, endtime) ] [ Day ]
         ex. "user1 schedules yaboi (user0,user1,user2,user3) (4:00pm,6:00pm) Friday".
+
+        Common free windows are found with
+        [user finding] finds [first|all] [ ( tuple of users ) ] [ duration ] [ Day ]
+        ex. "user1 finds first (user0,user1,user2) 1:30 Friday".
         """
 
         def create_arguements(cmd_string):
@@ -412,6 +1168,48 @@ class Node(object):
                 self.delete(X)
             #print "cancel: " + str(X)
 
+        def handle_find(cmd):
+            """Handle searches for common free windows."""
+            mode, participants, duration, day = cmd[2], cmd[3], cmd[4], cmd[5]
+
+            if day.lower() not in DAYS:
+                print "[ERROR]: Day not correct. use one of " + ", ".join(DAYS)
+                return
+
+            try:
+                participants = participants[1:-1].replace("user", "").split(',')
+                node_ids = [int(p) for p in participants]
+            except ValueError:
+                print "[ERROR]: use participants of the form (user0,user1)"
+                return
+
+            #durations are h:mm and a positive multiple of a slot
+            try:
+                hours, minutes = [int(part) for part in duration.split(":")]
+                if hours < 0 or not 0 <= minutes < 60:
+                    raise ValueError(duration)
+                duration = hours * 60 + minutes
+            except ValueError:
+                duration = 0
+            if duration <= 0 or duration % SLOT_MINUTES != 0:
+                print ("[ERROR]: Duration not correct. use h:mm, a multiple of "
+                    + str(SLOT_MINUTES) + " minutes")
+                return
+
+            if mode == "first":
+                window = self.find_earliest_window(node_ids, day, duration)
+                windows = [window] if window else []
+            elif mode == "all":
+                windows = self.find_free_windows(node_ids, day, duration)
+            else:
+                print "[ERROR]: Find mode not correct. use 'first' or 'all'"
+                return
+
+            if not windows:
+                print "NO FREE WINDOW"
+            for start, end in windows:
+                print str(start)[:-3] + " to " + str(end)[:-3]
+
         def handle_fail(cmd):
             """Handle failures."""
             self._save_state()
@@ -425,86 +1223,166 @@ class Node(object):
                 handle_schedule(args)
             elif command_type == "cancels":
                 handle_cancel(args)
+            elif command_type == "finds":
+                handle_find(args)
             elif command_type == "fail":
                 handle_fail(args)
             else:
-                print "[ERROR]: Command Type not correct. use 'schedules','cancels', or 'fail' "
+                print "[ERROR]: Command Type not correct. use 'schedules','cancels', 'finds', or 'fail' "
 
-    @staticmethod
-    def _get_conflicting_appointment(calendar, X):
-        """
-        Assuming a conflicting appointment, return the Appointment object
-        conflicting with X in calendar.
-        """
+def _has_appointment(calendar, X):
+    """Determine if dictionary calendar holds an Appointment equal to X."""
+    appointment = calendar.get(X._name)
+    return appointment is not None and appointment == X
 
-        #for each appointment in the calendar
-        for name, appointment in calendar.iteritems():
-            #if any appointment conflicts with new appointment X, they conflict
-            if is_appointments_conflicting(appointment, X):
-                return appointment
+def _by_name(appointments):
+    """
+    Return a dictionary of form [String: [Appointment]] of the Appointments
+    of iterable appointments by name.
+    """
+    by_name = {}
+    for X in appointments:
+        by_name.setdefault(X._name, []).append(X)
+    return by_name
+
+def _holds(by_name, X):
+    """Determine if dictionary by_name of _by_name holds Appointment X."""
+    for appointment in by_name.get(X._name, ()):
+        if appointment == X:
+            return True
+    return False
+
+def find_conflicts(existing, new):
+    """
+    Return a list of (new_index, Appointment) tuples of every Appointment in
+    list existing conflicting with the Appointment at new_index in list new.
 
-        raise KeyError(str(X) + " does not conflict with any Appointment.") 
+    Appointments only conflict with others on the same day, so both lists
+    are partitioned by day and each day is swept independently. The sweeps
+    run in this process; pickling the Appointments for a process pool costs
+    more than sweeping them.
+    """
+    #partition both lists by day, remembering each new appointment's index
+    days = {}
+    for X in existing:
+        days.setdefault(X._day.lower(), ([], [], []))[0].append(X)
+    for i, X in enumerate(new):
+        partition = days.setdefault(X._day.lower(), ([], [], []))
+        partition[1].append(X)
+        partition[2].append(i)
+
+    conflicts = []
+    for existing_day, new_day, indexes in days.values():
+        if not existing_day or not new_day:
+            continue
+        for i, j in find_conflicting_pairs(existing_day, new_day):
+            conflicts.append((indexes[i], existing_day[j]))
 
-def client_thread(conn, Node):
-    """Handle conflict detection and do receive."""
-    while 1:
-        data = conn.recv(8192)
+    return conflicts
 
-        if not data:
-            print("Ended connection")
-            break
+def client_frame(frame, Node):
+    """
+    Handle conflict detection and do receive for one frame from a peer;
+    return False once the peer ends its connection.
+    """
+    kind, sender, dest, accepts, data = frame
 
-        if data.decode("utf-8") == "terminate" or data.decode("utf-8") == "quit":
+    if kind == FRAME_CONTROL:
+        if data == "terminate" or data == "quit":
             print("Ending connection with client")
-            conn.close()
-            break
-
-        #copy the calendar before receiving data i.e. redefining this Node's
-        #calendar
-        from copy import deepcopy
-        pre_dict = deepcopy(Node._calendar)
-        NE = Node.receive(data)
-        #Get the appointments in new dictionary not in old dictionary that aren't deletes
-        new_entries = [event for event in NE if event._op_params not in pre_dict.values() and event._op != r"DELETE"]
-        new_entries = [event for event in new_entries if event._op_params in Node._calendar.values()]
-
-        #for each new appointment entry, if it's conflicting, handle it 
-        for new_event in new_entries:
-            #get the appointment for the new_event
-            new_appt = new_event._op_params
-            #if the appointment is conflicting with the dictionary before receive, we have a conflict
-            if Node._is_calendar_conflicting(new_appt, pre_dict):
-                #get original and new Appointments of the conflicting pair
-                original_appt = Node._get_conflicting_appointment(pre_dict, new_appt)
-
-                print str(original_appt._name) + '\t' + str(new_appt._name)
-                print str(new_event)
-
-                original_event = None
-
-                #for every entry in our log
-                for event in Node._log:
-                    #if the entry is the insert event corresponding to the original appointment,
-                    #save copy of the original event
-                    if event._op == "INSERT" and event._op_params == original_appt:
-                        original_event = event
-
-                if not original_event:
-                    Node._handle_conflict(new_appt)
-                else:
-                    oR_id = original_event._node_id
-                    nR_id = new_event._node_id
+            return False
+        return True
 
-                    if Node._T[Node._id][oR_id] < Node._T[Node._id][nR_id]:
-                        Node._handle_conflict(new_appt)
-                    elif Node._T[Node._id][oR_id] > Node._T[Node._id][nR_id]:
-                        Node._handle_conflict(original_appt)
-                    else:
-                        pass
+    Node.learn_accepts(sender, accepts)
+    Node.deliver(data)
+    return True
 
+def anti_entropy(Node):
+    """
+    Periodically send a digest of Node's time table row to a random peer so
+    missed events are pulled rather than waiting on some future push.
+    """
+    import random
+    import time
+
+    while 1:
+        time.sleep(ANTI_ENTROPY_INTERVAL * (1 + random.random() / 2))
 
-        #conn.send(b'ACK ' + data)
-    conn.close()
+        #membership changes under the lock; the digest is only queued and
+        #its sender thread does the connecting
+        with Node._lock:
+            peers = [k for k in Node._ids_to_IPs if k != Node._id]
+            if peers:
+                Node.send_digest(random.choice(peers))
+
+def print_page(N, message):
+    """
+    Stream the log or calendar of Node N to the console; "log [page]" and
+    "calendar [page]" print only the given page of PAGE_SIZE entries.
+    """
+    parts = message.split(" ")
+
+    if len(parts) > 2 or (len(parts) == 2 and not parts[1].isdigit()):
+        print "[ERROR]: use '" + parts[0] + "' or '" + parts[0] + " [page]'"
+        return
+
+    if len(parts) == 2:
+        start, count = int(parts[1]) * PAGE_SIZE, PAGE_SIZE
+    else:
+        start, count = 0, None
+
+    if parts[0] == "log":
+        sys.stdout.writelines(N.iter_log_lines(start, count))
+    else:
+        sys.stdout.writelines(N.iter_calendar_lines(start, count))
+
+def load_ids_to_IPs(path):
+    """
+    Return the node id to (IP, port) dictionary read from the members file at
+    path; every line is of the form "node_id ip port", and blank lines and
+    lines starting with # are ignored.
+    """
+    ids_to_IPs = {}
+    for line in open(path, "r"):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        parts = line.split()
+        if len(parts) != 3:
+            raise ValueError(
+                "members file lines must be of the form 'node_id ip port'.")
+
+        ids_to_IPs[int(parts[0])] = (parts[1], int(parts[2]))
+
+    return ids_to_IPs
+
+
+def membership_command(message, ids_to_IPs, members_path):
+    """
+    Return the node id to (IP, port) dictionary resulting from applying
+    console command message to dictionary ids_to_IPs, or None if message is
+    not a membership command.
+
+    "join [node id] [ip] [port]" adds a Node, "leave [node id]" removes one
+    and "reload" rereads the members file at members_path; ids and ports
+    that aren't numbers make message not a membership command. Raises
+    IOError or ValueError if the members file can't be reloaded.
+    """
+    parts = message.split(" ")
+    ids_to_IPs = dict(ids_to_IPs)
+
+    if (parts[0] == "join" and len(parts) == 4 and parts[1].isdigit()
+            and parts[3].isdigit()):
+        ids_to_IPs[int(parts[1])] = (parts[2], int(parts[3]))
+    elif parts[0] == "leave" and len(parts) == 2 and parts[1].isdigit():
+        ids_to_IPs.pop(int(parts[1]), None)
+    elif parts == ["reload"]:
+        ids_to_IPs = load_ids_to_IPs(members_path)
+    else:
+        return None
+
+    return ids_to_IPs
 
 def clear_console():
     """Clear output console."""
@@ -524,19 +1402,17 @@ def main():
     cmd3 = "user1 schedules test6 (user0,user1,user2,user3) (1:00pm,1:30pm) Monday"
     '''
     
-    Virginia_IP = "52.91.71.111"
-    Oregon_IP = "54.200.51.241"
-    California_IP = "52.8.87.23"
-    Ireland_IP = "52.16.157.196"
-
-    #init IP's of different regions
-    ids_to_IPs = {
-        0: (Virginia_IP, 9000),
-        1: (Oregon_IP, 9001),
-        2: (California_IP, 9002), 
-        3: (Ireland_IP, 9003)}
-
-    N = Node(node_id=int(sys.argv[1]), node_count=4, ids_to_IPs=ids_to_IPs)
+    #read the members of the system; the four AWS regions by default
+    import os
+    if len(sys.argv) > 3:
+        members_path = sys.argv[3]
+    else:
+        members_path = os.path.join(os.path.dirname(__file__), "members.txt")
+    ids_to_IPs = load_ids_to_IPs(members_path)
+
+    N = Node(
+        node_id=int(sys.argv[1]), node_count=max(ids_to_IPs) + 1,
+        ids_to_IPs=ids_to_IPs)
 
     #try to load a previous state of this Node
     try:
@@ -550,34 +1426,64 @@ def main():
     #bind to host of 0.0.0.0 for any TCP traffic through AWS
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.bind((HOST, PORT))
-    #backlog to; 1 for each process
-    sock.listen(4)
+    #connections wait in the backlog while the receive pool is full
+    sock.listen(LISTEN_BACKLOG)
+
+    #receive from peers on a fixed number of worker threads
+    pool = ReceivePool(lambda frame: client_frame(frame, N))
+
+    #pull missed events from peers in the background
+    thread.start_new_thread(anti_entropy, (N,))
 
     import select
     print("@> Node Started")
     while True:
-        r, w, x = select.select([sys.stdin, sock], [], [])
+        #stop accepting connections and reading from them while the receive
+        #pool is full
+        if pool.accepting():
+            r, w, x = select.select(
+                [sys.stdin, sock] + pool.watched(), [], [])
+        else:
+            r, w, x = select.select([sys.stdin], [], [], BACKPRESSURE_POLL)
         if not r:
             continue
-        if r[0] is sys.stdin:
+        if sys.stdin in r:
             message = raw_input('')
             if message == "quit":
-                N._save_state()
+                with N._lock:
+                    N._save_state()
+                N.close()
                 break
-            elif message == "log":
-                print N.print_log()
-            elif message == "calendar":
-                print N.print_calendar()
+            elif message.split(" ")[0] in ("log", "calendar"):
+                print_page(N, message)
             elif message == "print node":
-                print str(N)
+                sys.stdout.writelines(N.iter_node_lines())
             elif message == "clear":
                 clear_console()
+            elif message == "stats":
+                stats = pool.stats()
+                for key in sorted(stats):
+                    print key + ": " + str(stats[key])
+            elif message.split(" ")[0] in ("join", "leave", "reload"):
+                try:
+                    members = membership_command(
+                        message, N._ids_to_IPs, members_path)
+                except (IOError, ValueError) as e:
+                    print "[ERROR]: could not reload members: " + str(e)
+                else:
+                    if members is None:
+                        print "[ERROR]: use 'join [id] [ip] [port]', 'leave [id]' or 'reload'"
+                    else:
+                        with N._lock:
+                            N.update_membership(members)
             else:
-                N.parse_command(message)
-        else:
+                with N._lock:
+                    N.parse_command(message)
+        if sock in r:
             conn, addr = sock.accept()
             print ('Connected with ' + addr[0] + ':' + str(addr[1]))
-            thread.start_new_thread(client_thread ,(conn, N))
+            pool.add(conn)
+        pool.dispatch(r)
     sock.close()
     
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+"""
+Peer outbox for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+"""
+
+import threading
+from collections import deque
+
+
+class Outbox(object):
+    """
+    Messages awaiting a sender thread, holding only the newest of each key.
+
+    pending:        dictionary of form [key: item] of the newest item put
+                    with each key not yet taken by get.
+    order:          deque of the keys of pending in the order they were
+                    first put.
+    closed:         True once close has been called.
+
+    An item put while an older one of the same key is pending replaces it in
+    place, so however long a peer can't be reached its outbox never holds
+    more than one item per key; e.g. a newer partial log supersedes an older
+    one, as it holds every event the older one did that is still needed.
+    """
+
+    def __init__(self):
+        """Initialize an empty Outbox object."""
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._order = deque()
+        self._closed = False
+
+    def put(self, key, item):
+        """Queue item under key, replacing any pending item of key."""
+        with self._condition:
+            if self._closed:
+                return
+            if key not in self._pending:
+                self._order.append(key)
+            self._pending[key] = item
+            self._condition.notify()
+
+    def get(self):
+        """
+        Return the oldest pending item, waiting for one to be put, or None
+        once the outbox is closed and every item put before has been taken.
+        """
+        with self._condition:
+            while not self._order and not self._closed:
+                self._condition.wait()
+            if not self._order:
+                return None
+            return self._pending.pop(self._order.popleft())
+
+    def close(self):
+        """Stop accepting items; get returns None once the rest are taken."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
@@ -0,0 +1,170 @@
+"""
+Bounded receive worker pool for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+"""
+
+import os
+import Queue
+import threading
+from Codec import FrameReader
+
+#worker threads reading frames from peer connections
+RECEIVE_WORKERS = 4
+#readable connections waiting for a worker before the listener stops
+#accepting more and idle connections stop being watched
+RECEIVE_QUEUE_SIZE = 16
+#seconds a worker waits for the rest of a frame before closing its connection
+RECEIVE_TIMEOUT = 30.0
+
+
+class ReceivePool(object):
+    """
+    Fixed pool of worker threads handling frames from accepted peer
+    connections.
+
+    handler:        function called by a worker with each frame received;
+                    returns False once its connection should be closed.
+    queue:          bounded queue of (socket, FrameReader) tuples of readable
+                    connections awaiting a worker.
+    idle:           dictionary of form [socket: FrameReader] of the open
+                    connections no worker holds, to be watched for reading.
+    wake:           (read fd, write fd) tuple of a pipe written to whenever a
+                    worker hands a connection back to idle, so the watching
+                    select returns and watches it again.
+    stats:          dictionary of counters reported by stats().
+
+    A worker holds a connection only for the frames it has ready, then hands
+    it back, so long-lived connections such as those of Hosts never keep a
+    worker to themselves. The watching loop selects on watched(), adds each
+    accepted connection with add() and passes what is readable to dispatch().
+    When the queue is full accepting() is False; the loop should then stop
+    accepting and dispatching until it drains, so further peers wait in the
+    listen backlog and in their socket buffers rather than in memory.
+    """
+
+    def __init__(self, handler, workers=RECEIVE_WORKERS,
+            queue_size=RECEIVE_QUEUE_SIZE):
+        """Initialize a ReceivePool object and start its workers."""
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError("workers must be a positive int.")
+        if not isinstance(queue_size, int) or queue_size < 1:
+            raise ValueError("queue_size must be a positive int.")
+
+        self._handler = handler
+        self._queue = Queue.Queue(queue_size)
+        self._idle = {}
+        self._wake = os.pipe()
+        self._lock = threading.Lock()
+        self._paused = False
+        self._stats = {
+            "workers": workers, "queue_size": queue_size, "busy": 0,
+            "max_depth": 0, "accepted": 0, "frames": 0, "closed": 0,
+            "failed": 0, "backpressure": 0}
+
+        for i in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+
+    def accepting(self):
+        """
+        Determine if there is room to queue another connection, counting each
+        time the pool starts applying backpressure.
+        """
+        full = self._queue.full()
+        with self._lock:
+            if full and not self._paused:
+                self._stats["backpressure"] += 1
+            self._paused = full
+        return not full
+
+    def add(self, conn):
+        """Watch newly accepted connection conn for frames."""
+        conn.settimeout(RECEIVE_TIMEOUT)
+        with self._lock:
+            self._idle[conn] = FrameReader(conn)
+            self._stats["accepted"] += 1
+
+    def watched(self):
+        """Return a list of what the watching select should read from."""
+        with self._lock:
+            return [self._wake[0]] + self._idle.keys()
+
+    def dispatch(self, readable):
+        """
+        Queue the idle connections in list readable for a worker; those that
+        don't fit in the queue stay idle and are dispatched once readable
+        again.
+        """
+        for conn in readable:
+            if conn is self._wake[0]:
+                os.read(self._wake[0], 4096)
+                continue
+
+            with self._lock:
+                reader = self._idle.pop(conn, None)
+            if reader is None:
+                continue
+
+            try:
+                self._queue.put_nowait((conn, reader))
+            except Queue.Full:
+                with self._lock:
+                    self._idle[conn] = reader
+                continue
+
+            with self._lock:
+                depth = self._queue.qsize()
+                self._stats["max_depth"] = max(self._stats["max_depth"], depth)
+
+    def _serve(self, conn, reader):
+        """
+        Handle the next frame of conn and any others already buffered;
+        return False once conn is closed or should be.
+        """
+        frame = reader.read_frame()
+        if frame is None:
+            return False
+
+        while frame is not None:
+            with self._lock:
+                self._stats["frames"] += 1
+            if self._handler(frame) is False:
+                return False
+            frame = reader.next_frame()
+
+        return True
+
+    def _work(self):
+        """Handle queued connections a frame at a time, forever."""
+        while True:
+            conn, reader = self._queue.get()
+            with self._lock:
+                self._stats["busy"] += 1
+
+            outcome = "closed"
+            try:
+                if self._serve(conn, reader):
+                    outcome = None
+            except Exception as e:
+                outcome = "failed"
+                print "[ERROR]: receive failed: " + str(e)
+
+            with self._lock:
+                self._stats["busy"] -= 1
+                if outcome is None:
+                    self._idle[conn] = reader
+                else:
+                    self._stats[outcome] += 1
+
+            if outcome is None:
+                os.write(self._wake[1], "x")
+            else:
+                conn.close()
+
+    def stats(self):
+        """Return a dictionary of the pool's queue depth and counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        stats["depth"] = self._queue.qsize()
+        return stats
@@ -0,0 +1,114 @@
+"""
+Copy-on-write dictionary for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+"""
+
+#number of buckets the items of a SharedDict are spread over by key hash; a
+#change copies only the one bucket it touches
+BUCKETS = 256
+
+
+class SharedDict(object):
+    """
+    Immutable dictionary whose changed versions share structure with it.
+
+    buckets:        tuple of BUCKETS dictionaries, each holding the items
+                    whose keys hash to it.
+    size:           number of items held.
+
+    set and remove return a new SharedDict sharing every bucket but the one
+    changed instead of copying the whole dictionary; buckets are never
+    changed once a SharedDict holding them is made.
+    """
+
+    def __init__(self, items=None):
+        """Initialize a SharedDict object holding the items of dict items."""
+        buckets = [{} for i in range(BUCKETS)]
+        if items is not None:
+            for key, value in items.iteritems():
+                buckets[hash(key) % BUCKETS][key] = value
+
+        self._buckets = tuple(buckets)
+        self._size = sum(len(bucket) for bucket in buckets)
+
+    @classmethod
+    def _make(cls, buckets, size):
+        """Return a SharedDict object of tuple buckets holding size items."""
+        shared = cls.__new__(cls)
+        shared._buckets = buckets
+        shared._size = size
+        return shared
+
+    def _replace(self, index, bucket, size):
+        """Return a SharedDict like this one with bucket at index."""
+        buckets = self._buckets[:index] + (bucket,) + self._buckets[index + 1:]
+        return self._make(buckets, size)
+
+    def set(self, key, value):
+        """Return a SharedDict like this one with key mapped to value."""
+        index = hash(key) % BUCKETS
+        bucket = dict(self._buckets[index])
+        size = self._size if key in bucket else self._size + 1
+        bucket[key] = value
+        return self._replace(index, bucket, size)
+
+    def remove(self, key):
+        """Return a SharedDict like this one without key."""
+        index = hash(key) % BUCKETS
+        if key not in self._buckets[index]:
+            return self
+
+        bucket = dict(self._buckets[index])
+        del bucket[key]
+        return self._replace(index, bucket, self._size - 1)
+
+    def __len__(self):
+        """Return the number of items held."""
+        return self._size
+
+    def __contains__(self, key):
+        """Determine if key is held."""
+        return key in self._buckets[hash(key) % BUCKETS]
+
+    def __getitem__(self, key):
+        """Return the value of key; raises KeyError if it is not held."""
+        return self._buckets[hash(key) % BUCKETS][key]
+
+    def get(self, key, default=None):
+        """Return the value of key, or default if it is not held."""
+        return self._buckets[hash(key) % BUCKETS].get(key, default)
+
+    def iteritems(self):
+        """Iterate over the (key, value) items held."""
+        for bucket in self._buckets:
+            for item in bucket.iteritems():
+                yield item
+
+    def iterkeys(self):
+        """Iterate over the keys held."""
+        for bucket in self._buckets:
+            for key in bucket:
+                yield key
+
+    __iter__ = iterkeys
+
+    def itervalues(self):
+        """Iterate over the values held."""
+        for bucket in self._buckets:
+            for value in bucket.itervalues():
+                yield value
+
+    def items(self):
+        """Return a list of the (key, value) items held."""
+        return list(self.iteritems())
+
+    def keys(self):
+        """Return a list of the keys held."""
+        return list(self.iterkeys())
+
+    def values(self):
+        """Return a list of the values held."""
+        return list(self.itervalues())
+
+    def __reduce__(self):
+        """Pickle as the items held; hashes may differ where it's unpickled."""
+        return (SharedDict, (dict(self.iteritems()),))
@@ -0,0 +1,153 @@
+"""
+Free slot index for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+"""
+
+from datetime import time
+from Appointment import Appointment
+
+#appointments are enforced on half hour boundaries so a day is 48 slots
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = (24 * 60) // SLOT_MINUTES
+#an appointment can end no later than 11:30pm, so the final slot is never
+#schedulable
+LAST_END_SLOT = SLOTS_PER_DAY - 1
+
+def time_to_slot(t):
+    """Return the index of the half hour slot starting at time object t."""
+    if not isinstance(t, time):
+        raise TypeError("t must be of type time.")
+
+    return (t.hour * 60 + t.minute) // SLOT_MINUTES
+
+def slot_to_time(slot):
+    """Return the time object at which half hour slot slot starts."""
+    if not isinstance(slot, int):
+        raise TypeError("slot must be of type int.")
+    if slot < 0 or slot > LAST_END_SLOT:
+        raise ValueError(
+            "slot must be within range [0:" + str(LAST_END_SLOT) + "]")
+
+    minutes = slot * SLOT_MINUTES
+    return time(minutes // 60, minutes % 60)
+
+def appointment_mask(X):
+    """Return the occupancy bitmap of the slots covered by Appointment X."""
+    if not isinstance(X, Appointment):
+        raise TypeError("X must be of type Appointment.")
+
+    start, end = time_to_slot(X._start), time_to_slot(X._end)
+    return ((1 << (end - start)) - 1) << start
+
+
+class SlotIndex(object):
+    """
+    Per participant, per day occupancy index of a calendar.
+
+    masks:          dictionary of form [(Int, String): {String: Int}] mapping
+                    a participant and lower-cased day to the occupancy bitmap
+                    of every appointment name that participant has that day.
+    occupancy:      dictionary of form [(Int, String): Int] caching the union
+                    of the bitmaps in masks for each participant and day.
+
+    Bit s of a bitmap is set when half hour slot s of the day is occupied.
+    """
+
+    def __init__(self):
+        """Initialize an empty SlotIndex object."""
+        self._masks = {}
+        self._occupancy = {}
+
+    def add(self, X):
+        """Mark the slots of Appointment X as occupied for its participants."""
+        mask = appointment_mask(X)
+        day = X._day.lower()
+
+        for participant in X._participants:
+            key = (participant, day)
+            self._masks.setdefault(key, {})[X._name] = mask
+            self._occupancy[key] = self._occupancy.get(key, 0) | mask
+
+    def remove(self, X):
+        """Release the slots held by Appointment X for its participants."""
+        if not isinstance(X, Appointment):
+            raise TypeError("X must be of type Appointment.")
+
+        day = X._day.lower()
+
+        for participant in X._participants:
+            key = (participant, day)
+            masks = self._masks.get(key)
+            if not masks or masks.pop(X._name, None) is None:
+                continue
+
+            #recompute from the remaining masks; appointments received from
+            #other Nodes may overlap until conflict resolution removes them
+            occupied = 0
+            for mask in masks.itervalues():
+                occupied |= mask
+
+            if masks:
+                self._occupancy[key] = occupied
+            else:
+                del self._masks[key]
+                del self._occupancy[key]
+
+    def rebuild(self, calendar):
+        """Discard the index and rebuild it from dictionary calendar."""
+        self._masks = {}
+        self._occupancy = {}
+        for appointment in calendar.itervalues():
+            self.add(appointment)
+
+    def occupancy(self, participants, day):
+        """Return the union bitmap of participants' occupied slots on day."""
+        occupied = 0
+        for participant in participants:
+            occupied |= self._occupancy.get((participant, day.lower()), 0)
+        return occupied
+
+    def free_windows(self, participants, day, slot_count):
+        """
+        Return a list of (start_slot, end_slot) tuples of every maximal run
+        of slots on day of at least slot_count slots that is free for all of
+        participants, in order of start_slot.
+        """
+        if not isinstance(slot_count, int):
+            raise TypeError("slot_count must be of type int.")
+        if slot_count < 1:
+            raise ValueError("slot_count must be at least 1.")
+
+        occupied = self.occupancy(participants, day)
+        windows = []
+        slot = 0
+
+        while slot < LAST_END_SLOT:
+            #skip past occupied slots
+            if occupied >> slot & 1:
+                slot += 1
+                continue
+
+            #extend the free run as far as it goes
+            end = slot
+            while end < LAST_END_SLOT and not occupied >> end & 1:
+                end += 1
+
+            if end - slot >= slot_count:
+                windows.append((slot, end))
+
+            slot = end
+
+        return windows
+
+    def earliest_window(self, participants, day, slot_count):
+        """
+        Return the (start_slot, end_slot) tuple of the earliest window of
+        exactly slot_count slots on day free for all of participants, or None
+        if there is no such window.
+        """
+        windows = self.free_windows(participants, day, slot_count)
+        if not windows:
+            return None
+
+        start = windows[0][0]
+        return (start, start + slot_count)
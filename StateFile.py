@@ -0,0 +1,189 @@
+"""
+Memory-mapped state file for Distributed Calendar implemented with Wuu-Bernstein Algorithm.
+
+A state file is a magic string and the offset of its index, followed by one
+pickled record per logged event and finally the pickled index. The index
+holds everything a Node needs to answer peers (id, clock, 2DTT, calendar) and
+the offset, origin, time, operation and appointment name of every event
+record, so loading a state file only reads the index and deciding which
+events a peer lacks reads no record; events are unpickled from the
+memory-mapped file only once they're used.
+"""
+
+import os
+import mmap
+import struct
+import pickle
+
+MAGIC = "DCALSTA1"
+#offset of the index from the start of the file
+_HEADER = struct.Struct("!8sQ")
+
+
+def event_meta(e):
+    """
+    Return the (node_id, time, op, name) tuple of Event e, name being that of
+    its Appointment, or None for events of other operations.
+    """
+    name = None
+    if e._op == "INSERT" or e._op == r"DELETE":
+        name = e._op_params._name
+    return (e._node_id, e._time, e._op, name)
+
+
+class MappedLog(object):
+    """
+    Log of Event objects paged in from a memory-mapped state file.
+
+    buffer:         memory-mapped state file the events are read from, or
+                    None when every event is in memory.
+    offsets:        list of (offset, length) tuples of each event record in
+                    buffer, or None for events appended since it was read.
+    meta:           list of the event_meta tuple of each event, or None where
+                    a state file of an earlier version didn't record it.
+    events:         list of each event once it has been unpickled, else None.
+
+    Supports the list operations Node uses on its log; appending works
+    without paging in the events already in the log, and iter_meta lets
+    events be chosen by origin, time, operation and name without paging
+    them in.
+    """
+
+    def __init__(self, buffer=None, records=None):
+        """
+        Initialize a MappedLog object over buffer of the list records of the
+        (offset, length, node_id, time, op, name) tuples of its events.
+        """
+        records = records or []
+        self._buffer = buffer
+        self._offsets = [record[:2] for record in records]
+        self._meta = [tuple(record[2:]) or None for record in records]
+        self._events = [None] * len(records)
+
+    def __len__(self):
+        """Return the number of events in the log."""
+        return len(self._events)
+
+    def __getitem__(self, i):
+        """Return the event at index i, unpickling it on first access."""
+        event = self._events[i]
+        if event is None:
+            offset, length = self._offsets[i]
+            event = pickle.loads(self._buffer[offset:offset + length])
+            self._events[i] = event
+        return event
+
+    def __iter__(self):
+        """Iterate over the events of the log in order."""
+        for i in xrange(len(self._events)):
+            yield self[i]
+
+    def __contains__(self, e):
+        """Determine if the log holds an event equal to e."""
+        meta = event_meta(e)
+        for i, event_meta_i in self.iter_meta():
+            if event_meta_i == meta and self[i] == e:
+                return True
+        return False
+
+    def meta(self, i):
+        """Return the event_meta tuple of the event at index i."""
+        meta = self._meta[i]
+        if meta is None:
+            meta = event_meta(self[i])
+            self._meta[i] = meta
+        return meta
+
+    def iter_meta(self):
+        """Iterate over (index, event_meta tuple) pairs of the log in order."""
+        for i in xrange(len(self._events)):
+            yield i, self.meta(i)
+
+    def record(self, i):
+        """
+        Return the pickled record of the event at index i as it is in the
+        state file, or None if it is not in one.
+        """
+        if self._offsets[i] is None:
+            return None
+        offset, length = self._offsets[i]
+        return self._buffer[offset:offset + length]
+
+    def select(self, indexes):
+        """
+        Return a new MappedLog of the events at list indexes, sharing the
+        state file and the events already paged in.
+        """
+        log = MappedLog(self._buffer)
+        log._offsets = [self._offsets[i] for i in indexes]
+        log._meta = [self._meta[i] for i in indexes]
+        log._events = [self._events[i] for i in indexes]
+        return log
+
+    def append(self, e):
+        """Append event e to the log."""
+        self._offsets.append(None)
+        self._meta.append(event_meta(e))
+        self._events.append(e)
+
+def save_state(path, index, log):
+    """
+    Write dictionary index and the events of MappedLog log to a state file
+    at path.
+
+    The file is written beside path and renamed over it, so a MappedLog of
+    the previous file stays valid.
+    """
+    tmp_path = path + ".tmp"
+    f = open(tmp_path, "wb")
+    try:
+        f.write(_HEADER.pack(MAGIC, 0))
+
+        #records already in a state file are copied without unpickling
+        records = []
+        for i in xrange(len(log)):
+            record = log.record(i)
+            if record is None:
+                record = pickle.dumps(log[i], pickle.HIGHEST_PROTOCOL)
+            records.append((f.tell(), len(record)) + log.meta(i))
+            f.write(record)
+
+        index = dict(index)
+        index["log"] = records
+        index_offset = f.tell()
+        pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, index_offset))
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+
+    os.rename(tmp_path, path)
+
+def load_state(path):
+    """
+    Return the index dictionary of the state file at path, with its "log"
+    entry replaced by a MappedLog of the file's events.
+
+    Raises IOError if there is no file at path and ValueError if it is not
+    a state file.
+    """
+    f = open(path, "rb")
+    try:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise ValueError(path + " is not a state file.")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        #the mapping stays valid once the file is closed
+        f.close()
+
+    magic, index_offset = _HEADER.unpack(buffer[:_HEADER.size])
+    if magic != MAGIC:
+        buffer.close()
+        raise ValueError(path + " is not a state file.")
+
+    index = pickle.loads(buffer[index_offset:])
+    index["log"] = MappedLog(buffer, index["log"])
+    return index